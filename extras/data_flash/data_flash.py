@@ -32,11 +32,19 @@ SOFTWARE.
 """
 
 import csv
-from struct import unpack
+import mmap
+import re
+import sys
+from functools import lru_cache
+from itertools import chain
+from struct import Struct
 
 HEX_FORMAT = 16
 DATA_DESCRIPTIONS_FILE = 'data/data_descriptions.csv'
 
+"""Dump file line: "0xAAAA: [ AA BB ... ]" -> (address, hex bytes)"""
+DUMP_LINE_PATTERN = re.compile(rb'0x([0-9A-Fa-f]+):\s*\[\s*([0-9A-Fa-f ]*?)\s*]')
+
 
 class Address:
     START = 0x4000
@@ -47,8 +55,12 @@ class Address:
 
 
 FULL_ADDRESSES_RANGE = range(Address.START, Address.END + 1)
-ADDRESSES_WITHOUT_RA_TABLE = list(FULL_ADDRESSES_RANGE[:(Address.RA_TABLE_START - Address.START)]) \
-                             + list(FULL_ADDRESSES_RANGE[(Address.RA_TABLE_END - Address.START) + 1:])
+
+
+def addresses_without_ra_table():
+    """Full address range without the Ra table addresses"""
+    return chain(range(Address.START, Address.RA_TABLE_START),
+                 range(Address.RA_TABLE_END + 1, Address.END + 1))
 
 
 class DeviceDataFormat:
@@ -127,6 +139,38 @@ UNPACK_FORMATS = {
     DeviceDataFormat.TYPE_S: 's'
 }
 
+"""Precompiled structs for the fixed-size data formats"""
+UNPACK_STRUCTS = {data_format: Struct(UNPACK_FORMAT_LITTLE_ENDIAN + unpack_format)
+                  for data_format, unpack_format in UNPACK_FORMATS.items()
+                  if DeviceDataFormat.TYPE_S != data_format}
+
+
+@lru_cache(maxsize=None)
+def string_struct(str_len):
+    """Precompiled struct for a string of the specified length"""
+    return Struct(f'{UNPACK_FORMAT_LITTLE_ENDIAN}{str_len}{UNPACK_FORMATS[DeviceDataFormat.TYPE_S]}')
+
+
+def _string_value(dataset, offset):
+    """Unpack a string value: the length byte first, followed by the data bytes"""
+    _str_len = dataset[offset]
+    return string_struct(_str_len).unpack_from(dataset, offset + 1)[0].decode()
+
+
+def _make_value_formatter(data_format):
+    """Build a callable that unpacks a value of the fixed-size data format and formats it as a string"""
+    unpack_from = UNPACK_STRUCTS[data_format].unpack_from
+    if DeviceDataFormat.H1 == data_format:
+        return lambda dataset, offset: '0x{0:02X} = 0b{0:08b}'.format(unpack_from(dataset, offset)[0])
+    elif DeviceDataFormat.H2 == data_format:
+        return lambda dataset, offset: '0x{0:04X} = 0b{0:016b}'.format(unpack_from(dataset, offset)[0])
+    else:
+        return lambda dataset, offset: str(unpack_from(dataset, offset)[0])
+
+
+"""Per-format callables: (dataset, offset) -> formatted value string"""
+VALUE_FORMATTERS = {data_format: _make_value_formatter(data_format) for data_format in UNPACK_STRUCTS}
+
 
 def load_dump_data(file_name):
     """
@@ -139,102 +183,116 @@ def load_dump_data(file_name):
     ```
 
     :param file_name: Name of the Dump file
-    :return: A dictionary where keys are addresses and values are the corresponding values
+    :return: A bytearray covering the full address range, indexed by (addr - Address.START)
     """
-    retval = {}
-    with open(file_name, 'r') as file:
-        line = file.readline()
-        while line:
-            line = line.rstrip()  # remove trailing whitespaces
-
-            addr_str, values_str = line.split(': ')
-            addr = int(addr_str, HEX_FORMAT)
-
-            values = values_str.strip('[]').split()
-            for value in values:
-                retval[addr] = int(value, HEX_FORMAT)
-                addr += 1
-
-            line = file.readline()
+    retval = bytearray(Address.END - Address.START + 1)
+    with open(file_name, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for match in DUMP_LINE_PATTERN.finditer(mm):
+            addr = int(match.group(1), HEX_FORMAT)
+            values = bytes.fromhex(match.group(2).decode())  # fromhex skips the spaces between bytes
+            offset = addr - Address.START
+            retval[offset:offset + len(values)] = values
 
     return retval
 
 
 class DataFlashElement:
+    __slots__ = ('data_format', 'data_description', 'size')
+
     def __init__(self, data_format, data_description):
         self.data_format = data_format
         self.data_description = data_description
+        self.size = int(data_format[1:])  # number of data bytes, e.g. 'U2' -> 2, 'S21' -> 21
 
     def __str__(self) -> str:
         return f'{{type: {self.data_format}; name: {self.data_description}}}'
 
 
+@lru_cache(maxsize=1)
 def load_data_descriptions():
     """14.1 Data Flash Table"""
-    with open(DATA_DESCRIPTIONS_FILE, newline='') as csvfile:
-        csvreader = csv.reader(csvfile, delimiter=';')
-        next(csvreader)  # skip headers
-        retval = {}
-        for row in csvreader:
-            addr = int(row[0], 16)
-            data_format = row[1]
-            data_description = row[2]
-            retval[addr] = DataFlashElement(data_format, data_description)
-        return retval
+    with open(DATA_DESCRIPTIONS_FILE) as file:
+        lines = file.read().splitlines()
+
+    retval = {}
+    for line in lines[1:]:  # skip headers
+        if not line:
+            continue
+        addr_str, data_format, data_description = line.split(';', 2)
+        retval[int(addr_str, HEX_FORMAT)] = DataFlashElement(data_format, data_description)
+    return retval
+
+
+def _extract_raw(addr, data_description, dataset):
+    """Raw bytes of the record at the address, without any parsing or formatting"""
+    offset = addr - Address.START
+    return dataset[offset:offset + data_description.size]
+
+
+def _value_str(addr, data_description, dataset):
+    """Formatted value of the record at the address"""
+    offset = addr - Address.START
+    data_format = data_description.data_format
+    if DeviceDataFormat.TYPE_S == data_format[0]:
+        return _string_value(dataset, offset)
+    return VALUE_FORMATTERS[data_format](dataset, offset)
+
+
+"""Formatted records cache, keyed by (id(dataset), addr): a dataset compared
+against several others is parsed only once per address"""
+_parse_record_cache = {}
 
 
 def parse_record(addr, data_description, dataset):
     """Return data record at the address with the description"""
-    buf = []
-    size = int(data_description.data_format[1:])
-    for i in range(0, size):
-        buf.append(dataset[addr + i])
-
-    data_format_type = data_description.data_format[0]
-    if DeviceDataFormat.TYPE_S == data_format_type:
-        _str_len = buf[0]
-        bytes_buf = bytes(buf[1:_str_len + 1])
-        unpack_format = f'{UNPACK_FORMAT_LITTLE_ENDIAN}{_str_len}{UNPACK_FORMATS[DeviceDataFormat.TYPE_S]}'
-    else:
-        bytes_buf = bytes(buf)
-        unpack_format = f'{UNPACK_FORMAT_LITTLE_ENDIAN}{UNPACK_FORMATS[data_description.data_format]}'
-
-    value = unpack(unpack_format, bytes_buf)[0]
-    if DeviceDataFormat.H1 == data_description.data_format:
-        value_str = f'0x{value:02X} = 0b{value:08b}'
-    elif DeviceDataFormat.H2 == data_description.data_format:
-        value_str = f'0x{value:04X} = 0b{value:016b}'
-    elif DeviceDataFormat.TYPE_S == data_format_type:
-        value_str = value.decode()
-    else:
-        value_str = str(value)
+    cache_key = (id(dataset), addr)
+    retval = _parse_record_cache.get(cache_key)
+    if retval is not None:
+        return retval
+
+    value_str = _value_str(addr, data_description, dataset)
 
-    return f'0x{addr:04X}: ({data_description.data_format}) [{data_description.data_description}] = {value_str}'
+    retval = f'0x{addr:04X}: ({data_description.data_format}) [{data_description.data_description}] = {value_str}'
+    _parse_record_cache[cache_key] = retval
+    return retval
+
+
+def described_addresses(data_descriptions, addr_range):
+    """Addresses from the range that have a description, in ascending order"""
+    return sorted(data_descriptions.keys() & frozenset(addr_range))
+
+
+COMPARE_CSV_HEADER = ('Address', 'Data format', 'Description', 'Value 1', 'Value 2')
 
 
 def compare(addr_range, data_descriptions, dataset_1, dataset_2):
-    """Compare two datasets and print different records"""
-    for addr in addr_range:
+    """Compare two datasets and print different records as CSV rows:
 
-        data_description = data_descriptions.get(addr)
-        if data_description is None:
-            continue
+    ```
+    Address;Data format;Description;Value 1;Value 2
+    ```
+    """
+    rows = [COMPARE_CSV_HEADER]
+    for addr in described_addresses(data_descriptions, addr_range):
+        data_description = data_descriptions[addr]
 
-        value_1 = parse_record(addr, data_description, dataset_1)
-        value_2 = parse_record(addr, data_description, dataset_2)
+        if _extract_raw(addr, data_description, dataset_1) == _extract_raw(addr, data_description, dataset_2):
+            continue  # raw bytes are identical - no need to parse or format
+
+        value_1 = _value_str(addr, data_description, dataset_1)
+        value_2 = _value_str(addr, data_description, dataset_2)
 
         if value_1 != value_2:
-            print(f'dataset 1: {value_1}')
-            print(f'dataset 2: {value_2}')
-            print()
+            rows.append((f'0x{addr:04X}', data_description.data_format, data_description.data_description,
+                         value_1, value_2))
+
+    csv.writer(sys.stdout, delimiter=';', lineterminator='\n').writerows(rows)
 
 
 def print_data_detailed(addr_range, data_descriptions, dataset):
     """Print all data with their descriptions, if available"""
-    for addr in addr_range:
-        data_description = data_descriptions.get(addr)
-        if data_description is not None:
-            print(parse_record(addr, data_description, dataset))
+    for addr in described_addresses(data_descriptions, addr_range):
+        print(parse_record(addr, data_descriptions[addr], dataset))
 
 
 if __name__ == '__main__':
@@ -251,5 +309,5 @@ if __name__ == '__main__':
     # print_data_detailed(FULL_ADDRESSES_RANGE, _data_descriptions, _dump_20240710_lifetime_reset)
 
     # Compare two dump datasets
-    compare(ADDRESSES_WITHOUT_RA_TABLE, _data_descriptions, _dump_original, _dump_20240710)
+    compare(addresses_without_ra_table(), _data_descriptions, _dump_original, _dump_20240710)
     # compare(FULL_ADDRESSES_RANGE, _data_descriptions, _dump_20240710, _dump_20240710_lifetime_reset)